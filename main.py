@@ -7,20 +7,288 @@ Ultra-optimizado para MacBook Air M1 con ffmpeg
 import subprocess
 import numpy as np
 import argparse
+import asyncio
+import atexit
+import functools
 import os
+import hashlib
+import shutil
 import sys
 import tempfile
+import threading
 import json
 import re
-import wave
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import Tuple
 from tqdm import tqdm
 import time
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None  # numba es opcional: sin él, el kernel corre como Python puro
+
+# Patrones del stderr de ffmpeg, compilados una sola vez a nivel de módulo
+_MEAN_VOLUME_RE = re.compile(r'mean_volume: ([-\d\.]+) dB')
+_SILENCE_RE = re.compile(r'silence_(start|end): ([\d\.]+)')
+_LOUDNORM_JSON_RE = re.compile(r'\{[^{}]*"input_i"[^{}]*\}', re.DOTALL)
+
+# Prioridad de encoders por hardware: VideoToolbox primero (M1), luego GPUs dedicadas
+ENCODER_PRIORITY = ['h264_videotoolbox', 'h264_nvenc', 'h264_qsv', 'h264_vaapi', 'h264_amf']
+
+# Parámetros de calidad equivalente (~CRF 18-23) por encoder
+ENCODER_PARAMS = {
+    # Render offline: -tune film, nunca zerolatency (ese recorta throughput
+    # a la mitad y solo tiene sentido en streaming en vivo)
+    'libx264': ['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'film', '-crf', '18'],
+    'h264_nvenc': ['-c:v', 'h264_nvenc', '-preset', 'p5', '-rc', 'vbr', '-cq', '23'],
+    'hevc_nvenc': ['-c:v', 'hevc_nvenc', '-preset', 'p5', '-rc', 'vbr', '-cq', '23'],
+    'h264_amf': ['-c:v', 'h264_amf', '-quality', 'balanced', '-rc', 'cqp', '-qp_i', '22'],
+    'h264_qsv': ['-c:v', 'h264_qsv', '-global_quality', '23', '-preset', 'medium'],
+    'h264_vaapi': ['-c:v', 'h264_vaapi', '-qp', '23'],
+    'h264_videotoolbox': ['-c:v', 'h264_videotoolbox', '-q:v', '60'],
+}
+
+# Niveles de calidad por CRF (mejor calidad/byte que bitrates fijos para
+# material de cámara fija con cortes) y el flag equivalente por encoder
+QUALITY_SETTINGS = {
+    'low': {'crf': 28, 'preset': 'veryfast'},
+    'medium': {'crf': 23, 'preset': 'medium'},
+    'high': {'crf': 19, 'preset': 'slow'},
+}
+QUALITY_FLAG = {
+    'h264_nvenc': '-cq',
+    'hevc_nvenc': '-cq',
+    'h264_qsv': '-global_quality',
+    'h264_vaapi': '-qp',
+    'h264_amf': '-qp_i',
+}
+
+# VideoToolbox no habla CRF: usa -q:v en escala 1-100 donde más alto es mejor
+QUALITY_VIDEOTOOLBOX = {'low': '45', 'medium': '60', 'high': '75'}
+
+# Parámetros para previews descartables: el preset más rápido de x264, calidad
+# reducida y GOP corto; el tamaño del archivo no importa en un preview
+PREVIEW_VIDEO_PARAMS = ('-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'fastdecode',
+                        '-crf', '28', '-g', '60')
+
+# Filtro de escalado por encoder: con decode en GPU los frames viven en
+# memoria de video, así que el resize debe correr ahí mismo (scale_cuda/
+# scale_qsv) y no en swscale de CPU, que ni siquiera acepta esos frames
+ENCODER_SCALE_FILTER = {
+    'h264_nvenc': 'scale_cuda=1920:1080',
+    'hevc_nvenc': 'scale_cuda=1920:1080',
+    'h264_qsv': 'scale_qsv=1920:1080',
+}
+
+# Sufijo de filtros que algunos encoders exigen al final de la cadena de video
+# (VAAPI solo acepta superficies subidas a la GPU en nv12)
+ENCODER_FILTER_SUFFIX = {
+    'h264_vaapi': ',format=nv12,hwupload',
+}
+
+# Prefijos -hwaccel por encoder: decodifica en GPU y evita el round-trip
+# de frames por memoria de sistema (se insertan antes de cada -i de video)
+HWACCEL_PARAMS = {
+    'h264_nvenc': ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda', '-extra_hw_frames', '8'],
+    'hevc_nvenc': ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda', '-extra_hw_frames', '8'],
+    'h264_qsv': ['-hwaccel', 'qsv', '-hwaccel_output_format', 'qsv'],
+    'h264_vaapi': ['-vaapi_device', '/dev/dri/renderD128'],
+    'h264_videotoolbox': ['-hwaccel', 'videotoolbox'],
+}
+
+@functools.lru_cache(maxsize=1)
+def _detect_hw_encoder():
+    """
+    Detecta el mejor encoder por hardware disponible consultando
+    'ffmpeg -encoders' una sola vez (cacheado a nivel de módulo).
+    """
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True)
+    for encoder in ENCODER_PRIORITY:
+        if encoder in result.stdout:
+            return encoder
+    return 'libx264'
+
+def get_video_params(encoder='auto', quality=None):
+    """
+    Retorna los parámetros de encoding de video (tupla inmutable) según el
+    encoder. quality ('low'|'medium'|'high') ajusta el control de calidad en
+    modo CRF (o su equivalente -cq/-global_quality/-qp en encoders por
+    hardware) en vez de bitrates fijos.
+    """
+    if encoder == 'auto':
+        encoder = _detect_hw_encoder()
+        print(f"🎛️  Encoder seleccionado: {encoder}")
+    params = list(ENCODER_PARAMS[encoder])
+    if quality:
+        crf = str(QUALITY_SETTINGS[quality]['crf'])
+        if encoder == 'libx264':
+            params = ['-c:v', 'libx264', '-preset', QUALITY_SETTINGS[quality]['preset'],
+                      '-tune', 'film', '-crf', crf]
+        elif encoder == 'h264_videotoolbox':
+            params[params.index('-q:v') + 1] = QUALITY_VIDEOTOOLBOX[quality]
+        elif encoder in QUALITY_FLAG:
+            params[params.index(QUALITY_FLAG[encoder]) + 1] = crf
+            if encoder == 'h264_amf':
+                # AMF en cqp: fijar también el QP de los frames P
+                params += ['-qp_p', crf]
+    return tuple(params)
+
+def get_hwaccel_params(encoder='auto'):
+    """
+    Retorna el prefijo -hwaccel (tupla) a insertar antes de cada input de video.
+    La variable de entorno PODCAST_HWACCEL (auto|cuda|vaapi|none|...) fuerza
+    un modo concreto o desactiva la aceleración por completo.
+    """
+    override = os.environ.get('PODCAST_HWACCEL')
+    if override == 'none':
+        return ()
+    if override:
+        return ('-hwaccel', override)
+    if encoder == 'auto':
+        encoder = _detect_hw_encoder()
+    return tuple(HWACCEL_PARAMS.get(encoder, ()))
+
+def get_scale_filter(encoder='auto', hwaccel_params=None):
+    """
+    Filtro de resize a 1080p: scale_cuda/scale_qsv SOLO si el prefijo -hwaccel
+    realmente deja los frames en GPU (PODCAST_HWACCEL puede desactivarlo, y en
+    ese caso los frames son de software aunque el encoder sea NVENC/QSV).
+    """
+    if encoder == 'auto':
+        encoder = _detect_hw_encoder()
+    if hwaccel_params is None:
+        hwaccel_params = get_hwaccel_params(encoder)
+    if not hwaccel_keeps_gpu_frames(hwaccel_params):
+        return 'scale=1920:1080'
+    return ENCODER_SCALE_FILTER.get(encoder, 'scale=1920:1080')
+
+def hwaccel_keeps_gpu_frames(hwaccel_params):
+    """
+    True si el prefijo -hwaccel deja los frames decodificados en memoria de
+    GPU (cuda/qsv con output_format, o VAAPI): a esos frames no se les puede
+    imponer -pix_fmt ni filtros de software.
+    """
+    return '-hwaccel_output_format' in hwaccel_params or '-vaapi_device' in hwaccel_params
+
+def get_filter_suffix(encoder='auto'):
+    """Sufijo a concatenar al final de cada cadena de filtros de video."""
+    if encoder == 'auto':
+        encoder = _detect_hw_encoder()
+    return ENCODER_FILTER_SUFFIX.get(encoder, '')
+
+# Threads de limpieza en curso, para esperarlos (acotado) al salir del proceso
+_cleanup_threads = []
+
+def cleanup_async(paths):
+    """
+    Borra archivos temporales en un thread daemon: los unlink de miles de
+    clips chicos no bloquean el pipeline mientras hay trabajo útil que hacer.
+    """
+    def _remove():
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    t = threading.Thread(target=_remove, daemon=True)
+    t.start()
+    _cleanup_threads.append(t)
+
+@atexit.register
+def _join_cleanup_threads():
+    for t in _cleanup_threads:
+        t.join(timeout=5)
+
+def get_thread_params(encoder='auto', parallel_jobs=1):
+    """
+    Calcula -threads de modo que el total de threads ≈ cores cuando corren
+    varios ffmpeg en paralelo. Con encoder por hardware el encode va en el
+    ASIC, así que basta 1 thread de CPU.
+    """
+    if encoder == 'auto':
+        encoder = _detect_hw_encoder()
+    if encoder in HWACCEL_PARAMS:
+        return ('-threads', '1')
+    n_threads = max(1, (os.cpu_count() or 4) // parallel_jobs)
+    if encoder == 'libx264':
+        # Frame-threading (sliced-threads=0): mejor throughput para render
+        # offline; slice-threading solo paga cuando importa la latencia
+        return ('-threads', str(n_threads), '-x264-params',
+                f'threads={n_threads}:sliced-threads=0:lookahead-threads={max(2, n_threads // 4)}')
+    return ('-threads', str(n_threads))
+
+def _run_ffmpeg(cmd, error_context, progress_bar=None):
+    """
+    Ejecuta ffmpeg silenciando su salida (-loglevel error -nostats) para no
+    buffear megabytes de líneas de progreso en memoria Python. Si falla,
+    levanta RuntimeError con solo la cola del stderr (acotada a 4KB).
+
+    Con progress_bar (tqdm con total en segundos) agrega -progress pipe:1 y
+    actualiza la barra en streaming parseando out_time_us, línea por línea.
+    """
+    cmd = [cmd[0], '-hide_banner', '-loglevel', 'error', '-nostats'] + list(cmd[1:])
+    if progress_bar is None:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            stderr = result.stderr[-4096:].decode(errors='replace')
+            raise RuntimeError(f"{error_context}: {stderr}")
+        return
+    cmd[1:1] = ['-progress', 'pipe:1']
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, bufsize=1)
+    # Drenar stderr en paralelo: si ffmpeg llena ese pipe mientras acá se lee
+    # stdout, ambos procesos quedarían bloqueados esperándose mutuamente
+    stderr_chunks = []
+    drain = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    drain.start()
+    ultimo = 0.0
+    for line in proc.stdout:
+        if line.startswith('out_time_us='):
+            try:
+                segundos = int(line.split('=', 1)[1]) / 1e6
+            except ValueError:
+                continue
+            progress_bar.update(segundos - ultimo)
+            ultimo = segundos
+    proc.wait()
+    drain.join()
+    if proc.returncode != 0:
+        stderr = stderr_chunks[0] if stderr_chunks else ''
+        raise RuntimeError(f"{error_context}: {stderr[-4096:]}")
+
+def _run_ffmpeg_capture(cmd, error_context):
+    """
+    Como _run_ffmpeg pero captura stdout binario: para comandos que emiten
+    PCM crudo por pipe:1 en vez de escribir un archivo intermedio.
+    """
+    cmd = [cmd[0], '-hide_banner', '-loglevel', 'error', '-nostats'] + list(cmd[1:])
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        stderr = result.stderr[-4096:].decode(errors='replace')
+        raise RuntimeError(f"{error_context}: {stderr}")
+    return result.stdout
+
+async def _run_ffmpeg_async(cmd, error_context, sem):
+    """
+    Variante asyncio de _run_ffmpeg para fan-outs grandes: un solo event loop
+    supervisa N procesos ffmpeg (acotados por el semáforo) sin gastar un
+    thread Python bloqueado por cada uno.
+    """
+    async with sem:
+        full_cmd = [cmd[0], '-hide_banner', '-loglevel', 'error', '-nostats'] + list(cmd[1:])
+        proc = await asyncio.create_subprocess_exec(
+            *full_cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"{error_context}: {stderr[-4096:].decode(errors='replace')}")
+
+@functools.lru_cache(maxsize=1)
 def check_dependencies():
-    """Verifica que ffmpeg esté instalado"""
+    """Verifica que ffmpeg esté instalado (una sola vez por proceso)"""
     try:
-        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+        subprocess.run(['ffmpeg', '-version'], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
     except (subprocess.CalledProcessError, FileNotFoundError):
         print("Error: ffmpeg no está instalado o no está en el PATH")
         print("Instala con: brew install ffmpeg")
@@ -33,53 +301,70 @@ def get_audio_energy_fast(video_path, segment_duration=0.5):
     """
     print(f"Analizando audio de {os.path.basename(video_path)}...")
     
-    # Comando optimizado para análisis rápido
+    # Comando optimizado para análisis rápido: sin decode de video (-vn) y
+    # midiendo sobre una copia mono a 16kHz — los dB y silencios salen iguales
+    # con ~6x menos muestras por el filtro
     cmd = [
         'ffmpeg',
         '-i', video_path,
-        '-af', f'silencedetect=noise=-30dB:duration=0.1,volumedetect',
+        '-vn',
+        '-af', f'aresample=16000,aformat=channel_layouts=mono,silencedetect=noise=-30dB:duration=0.1,volumedetect',
         '-f', 'null',
         '-'
     ]
     
     result = subprocess.run(cmd, capture_output=True, text=True)
-    
-    # Parsear información de volumen y silencios
-    stderr_lines = result.stderr.split('\n')
-    
-    # Obtener duración total
-    duration = 0
-    for line in stderr_lines:
-        if 'Duration:' in line:
-            time_match = re.search(r'Duration: ([0-9:\.]+)', line)
-            if time_match:
-                time_str = time_match.group(1)
-                h, m, s = time_str.split(':')
-                duration = int(h) * 3600 + int(m) * 60 + float(s)
-                break
-    
+
+    # Parsear información de volumen y silencios con los regex precompilados:
+    # un solo scan del stderr por patrón, sin partir en líneas
+    stderr = result.stderr
+
+    # Obtener duración total del índice del contenedor (ffprobe cacheado),
+    # no del banner de ffmpeg, que es lento de parsear y frágil
+    duration = get_video_info(video_path)['duration']
+
     # Obtener nivel de volumen promedio
     volume_db = -60  # Valor por defecto muy bajo
-    for line in stderr_lines:
-        if 'mean_volume:' in line:
-            vol_match = re.search(r'mean_volume: ([-\d\.]+) dB', line)
-            if vol_match:
-                volume_db = float(vol_match.group(1))
-                break
-    
+    vol_match = _MEAN_VOLUME_RE.search(stderr)
+    if vol_match:
+        volume_db = float(vol_match.group(1))
+
     # Detectar silencios para crear timeline básica
     silence_periods = []
-    for line in stderr_lines:
-        if 'silence_start:' in line:
-            start_match = re.search(r'silence_start: ([\d\.]+)', line)
-            if start_match:
-                silence_start = float(start_match.group(1))
-        elif 'silence_end:' in line:
-            end_match = re.search(r'silence_end: ([\d\.]+)', line)
-            if end_match:
-                silence_end = float(end_match.group(1))
-                silence_periods.append((silence_start, silence_end))
-    
+    silence_start = None
+    for silence_match in _SILENCE_RE.finditer(stderr):
+        if silence_match.group(1) == 'start':
+            silence_start = float(silence_match.group(2))
+        elif silence_start is not None:
+            silence_periods.append((silence_start, float(silence_match.group(2))))
+
+    return duration, volume_db, silence_periods
+
+def analyze_energy_from_array(audio, sample_rate=16000, noise_db=-30.0, min_silence=0.1):
+    """
+    Equivalente NumPy de get_audio_energy_fast sobre un array ya decodificado:
+    mismo contrato (duración, volumen medio en dB, períodos de silencio) sin
+    pagar un segundo decode de ffmpeg por pista de análisis.
+    """
+    duration = len(audio) / sample_rate
+    audio = np.asarray(audio, dtype=np.float64)
+    power = float(np.mean(audio ** 2)) if len(audio) else 0.0
+    volume_db = 10 * np.log10(power) if power > 0 else -60
+
+    # RMS por ventanas de 10ms (aproxima la ventana de silencedetect) y
+    # detección vectorizada de tramos por debajo del umbral
+    frame = max(1, int(0.01 * sample_rate))
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return duration, volume_db, []
+    rms = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    quiet = np.concatenate(([False], rms < 10 ** (noise_db / 20), [False]))
+    edges = np.flatnonzero(np.diff(quiet.astype(np.int8)))
+    run_starts, run_ends = edges[0::2], edges[1::2]
+    frame_sec = frame / sample_rate
+    keep = (run_ends - run_starts) * frame_sec >= min_silence
+    silence_periods = list(zip((run_starts[keep] * frame_sec).tolist(),
+                               (run_ends[keep] * frame_sec).tolist()))
     return duration, volume_db, silence_periods
 
 def create_simple_timeline(duration1, vol1, silence1, duration2, vol2, silence2, min_segment=2.0):
@@ -97,52 +382,46 @@ def create_simple_timeline(duration1, vol1, silence1, duration2, vol2, silence2,
     primary_speaker = 1 if vol1 > vol2 + 3 else 2  # 3dB de diferencia
     current_speaker = primary_speaker
     
-    # Crear segmentos basados en silencios
-    all_events = []
-    
-    # Agregar eventos de silencio del video 1
+    # Crear segmentos basados en silencios: eventos como arrays SoA
+    # (tiempo, delta de actividad por speaker) en vez de lista de tuplas
+    times = []
+    deltas1 = []
+    deltas2 = []
+
+    # Agregar eventos de silencio del video 1 (-1 = empieza silencio, +1 = termina)
     for start, end in silence1:
         if start < total_duration:
-            all_events.append((start, 'silence_start_1'))
-            all_events.append((min(end, total_duration), 'silence_end_1'))
-    
+            times += [start, min(end, total_duration)]
+            deltas1 += [-1, 1]
+            deltas2 += [0, 0]
+
     # Agregar eventos de silencio del video 2
     for start, end in silence2:
         if start < total_duration:
-            all_events.append((start, 'silence_start_2'))
-            all_events.append((min(end, total_duration), 'silence_end_2'))
-    
-    # Ordenar eventos por tiempo
-    all_events.sort()
-    
-    # Estado de actividad (True = hablando, False = silencio)
-    speaker1_active = True
-    speaker2_active = True
-    
-    for time, event in all_events:
-        # Determinar nuevo speaker antes del cambio de estado
-        if speaker1_active and not speaker2_active:
-            new_speaker = 1
-        elif speaker2_active and not speaker1_active:
-            new_speaker = 2
-        else:
-            new_speaker = primary_speaker  # Default cuando ambos hablan o ambos callan
-        
-        # Si hay cambio de speaker y el segmento es suficientemente largo
-        if new_speaker != current_speaker and time - current_time >= min_segment:
-            segments.append((current_time, time, current_speaker))
-            current_speaker = new_speaker
-            current_time = time
-        
-        # Actualizar estado de actividad
-        if event == 'silence_start_1':
-            speaker1_active = False
-        elif event == 'silence_end_1':
-            speaker1_active = True
-        elif event == 'silence_start_2':
-            speaker2_active = False
-        elif event == 'silence_end_2':
-            speaker2_active = True
+            times += [start, min(end, total_duration)]
+            deltas1 += [0, 0]
+            deltas2 += [-1, 1]
+
+    if times:
+        # Ordenar eventos por tiempo y resolver el estado de actividad
+        # (True = hablando) con sumas acumuladas vectorizadas
+        times = np.asarray(times)
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        # Estado ANTES de aplicar cada evento (como el loop original)
+        active1 = np.concatenate(([1], 1 + np.cumsum(np.asarray(deltas1)[order])))[:-1] > 0
+        active2 = np.concatenate(([1], 1 + np.cumsum(np.asarray(deltas2)[order])))[:-1] > 0
+        # Default cuando ambos hablan o ambos callan: primary_speaker
+        new_speakers = np.where(active1 & ~active2, 1,
+                                np.where(active2 & ~active1, 2, primary_speaker))
+
+        # Emisión de cortes: pase secuencial corto solo sobre los eventos
+        for event_time, new_speaker in zip(times.tolist(), new_speakers.tolist()):
+            # Si hay cambio de speaker y el segmento es suficientemente largo
+            if new_speaker != current_speaker and event_time - current_time >= min_segment:
+                segments.append((current_time, event_time, current_speaker))
+                current_speaker = new_speaker
+                current_time = event_time
     
     # Agregar segmento final
     if current_time < total_duration:
@@ -160,23 +439,128 @@ def create_simple_timeline(duration1, vol1, silence1, duration2, vol2, silence2,
     
     return segments
 
+def to_soa(segments):
+    """
+    Convierte la timeline (lista de tuplas (start, end, speaker)) a arrays
+    SoA: (starts, ends, speakers). Los pases numéricos (coalescing, cortes,
+    búsquedas) trabajan sobre estos arrays; las tuplas quedan solo como
+    formato de intercambio.
+    """
+    n = len(segments)
+    starts = np.fromiter((start for start, _, _ in segments), dtype=np.float64, count=n)
+    ends = np.fromiter((end for _, end, _ in segments), dtype=np.float64, count=n)
+    speakers = np.fromiter((speaker for _, _, speaker in segments), dtype=np.int64, count=n)
+    return starts, ends, speakers
+
+def _coalesce_and_filter(speakers, starts, ends, min_dur):
+    # Loop numérico compacto sobre arrays, compilable por Numba en nopython
+    n = speakers.shape[0]
+    out_speakers = np.empty(n, speakers.dtype)
+    out_starts = np.empty(n, starts.dtype)
+    out_ends = np.empty(n, ends.dtype)
+    m = 0
+    for i in range(n):
+        if m > 0 and speakers[i] == out_speakers[m-1] and abs(starts[i] - out_ends[m-1]) < 1e-6:
+            # Mismo speaker y contiguo: extender el segmento anterior
+            out_ends[m-1] = ends[i]
+        elif m > 0 and ends[i] - starts[i] < min_dur:
+            # Demasiado corto para un corte de cámara: absorberlo en el anterior
+            out_ends[m-1] = ends[i]
+        else:
+            out_speakers[m] = speakers[i]
+            out_starts[m] = starts[i]
+            out_ends[m] = ends[i]
+            m += 1
+    return out_speakers[:m], out_starts[:m], out_ends[:m]
+
+if njit is not None:
+    _coalesce_and_filter = njit(cache=True)(_coalesce_and_filter)
+
+def coalesce_segments(segments, min_duration=0.0):
+    """
+    Une segmentos consecutivos del mismo speaker con tiempos contiguos y
+    absorbe segmentos más cortos que min_duration en el anterior.
+    Menos segmentos = menos nodos trim en el filter graph y menos entradas
+    de concat. El kernel corre sobre arrays SoA y se JIT-compila con Numba
+    cuando está instalada (cache=True para no pagar recompilación).
+    """
+    if not segments:
+        return []
+    starts, ends, speakers = to_soa(segments)
+    out_speakers, out_starts, out_ends = _coalesce_and_filter(speakers, starts, ends, min_duration)
+    return list(zip(out_starts.tolist(), out_ends.tolist(), out_speakers.tolist()))
+
+def truncate_timeline(segments, max_time):
+    """
+    Recorta una timeline ordenada a max_time buscando sobre el array SoA de
+    inicios (O(log N) en vez de escanear toda la lista) y ajustando el último fin.
+    """
+    if not segments:
+        return []
+    starts, _, _ = to_soa(segments)
+    cut = int(np.searchsorted(starts, max_time, side='left'))
+    segments = segments[:cut]
+    if segments and segments[-1][1] > max_time:
+        start, _, speaker = segments[-1]
+        segments[-1] = (start, max_time, speaker)
+    return segments
+
+def build_transition_concat_cmd(batch_paths, output_path, video_params, transition='fade', transition_duration=0.5, device_params=(), filter_suffix=''):
+    """
+    Construye un solo comando ffmpeg que concatena los batches encadenando
+    xfade (video) y acrossfade (audio): las transiciones salen en la misma
+    pasada de decode/encode, sin un segundo render de toda la timeline.
+    device_params lleva las opciones globales de dispositivo (VAAPI) y
+    filter_suffix el tramo final que el encoder exija (format=nv12,hwupload):
+    xfade corre sobre frames de software, la subida a GPU va al final.
+    """
+    cmd = ['ffmpeg', *device_params]
+    for path in batch_paths:
+        cmd += ['-i', path]
+    durations = [get_video_info(path)['duration'] for path in batch_paths]
+    filter_parts = []
+    v_prev, a_prev = '[0:v]', '[0:a]'
+    offset = durations[0]
+    for i in range(1, len(batch_paths)):
+        offset -= transition_duration
+        v_out, a_out = f'[v{i}]', f'[a{i}]'
+        filter_parts.append(
+            f"{v_prev}[{i}:v]xfade=transition={transition}:duration={transition_duration}:offset={offset:.3f}{v_out};")
+        filter_parts.append(f"{a_prev}[{i}:a]acrossfade=d={transition_duration}{a_out};")
+        v_prev, a_prev = v_out, a_out
+        offset += durations[i]
+    if filter_suffix:
+        filter_parts.append(f"{v_prev}{filter_suffix.lstrip(',')}[vfinal];")
+        v_prev = '[vfinal]'
+    cmd += [
+        '-filter_complex', ''.join(filter_parts).rstrip(';'),
+        '-map', v_prev, '-map', a_prev,
+        *video_params,
+        *(() if filter_suffix else ('-pix_fmt', 'yuv420p')),
+        '-c:a', 'aac', '-b:a', '128k',
+        '-movflags', '+faststart', '-y', output_path
+    ]
+    return cmd
+
+def _concat_escape(path):
+    """Ruta absoluta con comillas simples escapadas para listas del concat demuxer."""
+    return os.path.abspath(path).replace("'", "'\\''")
+
 def create_ffmpeg_concat_file(segments, video1_path, video2_path):
     """
     Crea archivos de concatenación para ffmpeg (método más eficiente)
     """
-    # Crear archivo temporal para la lista de concatenación
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
+    # Payload completo en bytes y UN solo write: sin encode por línea
+    payload = b''.join(
+        (f"file '{_concat_escape(video1_path if speaker == 1 else video2_path)}'\n"
+         f"inpoint {start:.2f}\n"
+         f"outpoint {end:.2f}\n").encode()
+        for start, end, speaker in segments
+    )
+    with tempfile.NamedTemporaryFile(mode='wb', suffix='.txt', delete=False) as f:
         concat_file = f.name
-        
-        for start, end, speaker in segments:
-            video_path = video1_path if speaker == 1 else video2_path
-            duration = end - start
-            
-            # Escribir entrada para concat
-            f.write(f"file '{os.path.abspath(video_path)}'\n")
-            f.write(f"inpoint {start:.2f}\n")
-            f.write(f"outpoint {end:.2f}\n")
-    
+        f.write(payload)
+
     return concat_file
 
 def create_preview_clips(video1_path, video2_path, preview_duration):
@@ -188,282 +572,689 @@ def create_preview_clips(video1_path, video2_path, preview_duration):
     
     print(f"🎬 Extrayendo primeros {preview_duration}s de cada video...")
     
-    # Extraer preview del video 1
+    # Extraer preview del video 1 (-ss/-t del lado del input: seek a nivel de
+    # contenedor, sin demuxear los paquetes que no entran en el preview)
     cmd1 = [
         'ffmpeg',
+        '-ss', '0', '-t', str(preview_duration),
         '-i', video1_path,
-        '-t', str(preview_duration),
         '-c', 'copy',  # Copia sin recodificar (ultra rápido)
+        '-map', '0',
         '-avoid_negative_ts', 'make_zero',
+        '-movflags', '+faststart',
         '-y',
         temp_video1
     ]
-    
+
     # Extraer preview del video 2
     cmd2 = [
         'ffmpeg',
+        '-ss', '0', '-t', str(preview_duration),
         '-i', video2_path,
-        '-t', str(preview_duration),
         '-c', 'copy',  # Copia sin recodificar (ultra rápido)
+        '-map', '0',
         '-avoid_negative_ts', 'make_zero',
+        '-movflags', '+faststart',
         '-y',
         temp_video2
     ]
     
     # Ejecutar ambos comandos
-    result1 = subprocess.run(cmd1, capture_output=True, text=True)
-    result2 = subprocess.run(cmd2, capture_output=True, text=True)
-    
-    if result1.returncode != 0 or result2.returncode != 0:
-        print(f"❌ Error creando clips de preview")
-        print(f"Error video1: {result1.stderr}")
-        print(f"Error video2: {result2.stderr}")
+    try:
+        _run_ffmpeg(cmd1, "Error creando clip de preview del video 1")
+        _run_ffmpeg(cmd2, "Error creando clip de preview del video 2")
+    except RuntimeError as e:
+        print(f"❌ {e}")
         return None, None
-    
+
     print(f"✅ Clips de preview creados")
     return temp_video1, temp_video2
 
-def extract_audio(input_path: str, output_path: str, duration: float = None) -> None:
+@functools.lru_cache(maxsize=256)
+def _probe(path: str, mtime_ns: int, size: int) -> dict:
     """
-    Extrae el audio de un video o archivo de audio a un archivo WAV mono.
-    Si duration está definido, recorta a los primeros N segundos.
+    Ejecuta ffprobe una sola vez por (archivo, mtime, tamaño). No llamar
+    directo: usar get_video_info, que arma la clave con un único os.stat.
     """
     cmd = [
-        'ffmpeg',
-        '-i', input_path,
-        '-ac', '1',  # Mono
-        '-ar', '16000',  # 16kHz para eficiencia
-        '-vn',  # Sin video
-        '-y',
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,width,height,pix_fmt,r_frame_rate',
+        '-show_entries', 'format=duration',
+        '-of', 'json', path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Error obteniendo info de {path}: {result.stderr}")
+    info = json.loads(result.stdout)
+    stream = (info.get('streams') or [{}])[0]
+    return {
+        'codec_name': stream.get('codec_name'),
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+        'pix_fmt': stream.get('pix_fmt'),
+        'fps': stream.get('r_frame_rate'),
+        'duration': float(info['format']['duration']),
+    }
+
+def _probe_format(path: str) -> Tuple[float, int]:
+    """
+    Obtiene (duración, tamaño en bytes) con un ffprobe mínimo en formato csv:
+    sin -show_streams ni decode de JSON, para el print informativo final.
+    """
+    cmd = [
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration,size',
+        '-of', 'csv=p=0', path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Error obteniendo formato de {path}: {result.stderr}")
+    duration, size = result.stdout.strip().split(',')
+    return float(duration), int(size)
+
+def get_video_info(path: str) -> dict:
+    """Info cacheada de un archivo (codec, resolución, pix_fmt, fps, duración)."""
+    st = os.stat(path)
+    return _probe(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+@functools.lru_cache(maxsize=64)
+def _keyframe_index(path: str, mtime_ns: int, size: int) -> np.ndarray:
+    """
+    PTS de los keyframes del stream de video como array float64 ordenado.
+    Se obtiene a nivel de paquete (flags, sin decodificar) y se cachea por
+    (archivo, mtime, tamaño) igual que _probe. Usar via get_keyframes.
+    """
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path
     ]
-    if duration:
-        cmd += ['-t', str(duration)]
-    cmd += [output_path]
     result = subprocess.run(cmd, capture_output=True, text=True)
     if result.returncode != 0:
-        raise RuntimeError(f"Error extrayendo audio: {result.stderr}")
+        raise RuntimeError(f"Error indexando keyframes de {path}: {result.stderr}")
+    return np.fromiter(
+        (float(line.split(',', 1)[0]) for line in result.stdout.splitlines()
+         if ',K' in line and not line.startswith('N/A')),
+        dtype=np.float64)
+
+def get_keyframes(path: str) -> np.ndarray:
+    """Índice de keyframes cacheado de un archivo de video."""
+    st = os.stat(path)
+    return _keyframe_index(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+def snap_to_keyframe(keyframes: np.ndarray, t: float) -> float:
+    """Ajusta t al keyframe anterior más cercano (o lo deja igual si no hay)."""
+    idx = int(np.searchsorted(keyframes, t, side='right')) - 1
+    if idx < 0 or keyframes.size == 0:
+        return t
+    return float(keyframes[idx])
+
+def probe_stream_params(video_path: str) -> Tuple[str, int, int, str]:
+    """Obtiene (codec, ancho, alto, pix_fmt) del stream de video, cacheado."""
+    info = get_video_info(video_path)
+    return (info['codec_name'], info['width'], info['height'], info['pix_fmt'])
+
+def extract_frames(video_path, timestamps, out_pattern):
+    """
+    Extrae N frames (para thumbnails/inspección) en UNA sola invocación de
+    ffmpeg con select, en vez de un proceso por frame: un decode del video
+    y cero forks extra. out_pattern estilo 'frame_%03d.jpg'.
+    """
+    if not timestamps:
+        return
+    select_expr = "+".join(f"between(t,{t - 0.01:.3f},{t + 0.01:.3f})" for t in sorted(timestamps))
+    cmd = [
+        'ffmpeg',
+        '-i', video_path,
+        '-vf', f"select='{select_expr}',setpts=N/FRAME_RATE/TB",
+        '-vsync', 'vfr', '-q:v', '2', '-y', out_pattern
+    ]
+    _run_ffmpeg(cmd, "Error extrayendo frames")
 
-def read_wav_mono(path: str) -> np.ndarray:
-    """Lee un archivo WAV mono y lo retorna como un array de float32 normalizado."""
-    with wave.open(path, 'rb') as wf:
-        assert wf.getnchannels() == 1
-        frames = wf.readframes(wf.getnframes())
-        audio = np.frombuffer(frames, dtype=np.int16).astype(np.float32)
-        audio /= 32768.0
-    return audio
+def normalize_audio(input_path: str, output_path: str, target_i: float = -16.0) -> None:
+    """
+    Normaliza el loudness en UNA sola pasada (loudnorm dinámico).
+    El measure+apply clásico decodifica el archivo dos veces; esta variante
+    cuesta un solo decode y para voz de podcast el resultado es equivalente.
+
+    Antes de aplicar, mide sobre una copia mono a 16kHz (barato): si la
+    fuente ya está a ±0.5 LU del target con true peak < -1 dBTP, se copia
+    tal cual y se ahorra el decode+encode completo.
+    """
+    measure_cmd = [
+        'ffmpeg', '-i', input_path, '-vn',
+        '-af', f'aresample=16000,aformat=channel_layouts=mono,loudnorm=I={target_i}:TP=-1.0:LRA=11.0:print_format=json',
+        '-f', 'null', '-'
+    ]
+    result = subprocess.run(measure_cmd, capture_output=True, text=True)
+    loudnorm_match = _LOUDNORM_JSON_RE.search(result.stderr)
+    if result.returncode == 0 and loudnorm_match:
+        info = json.loads(loudnorm_match.group(0))
+        try:
+            if abs(float(info['input_i']) - target_i) < 0.5 and float(info.get('input_tp', 0.0)) < -1.0:
+                print("🔊 Loudness ya dentro de tolerancia, copiando sin re-encodear")
+                shutil.copyfile(input_path, output_path)
+                return
+        except (KeyError, ValueError):
+            pass
+    cmd = [
+        'ffmpeg',
+        '-i', input_path,
+        '-af', f'loudnorm=I={target_i}:TP=-1.0:LRA=11.0',
+        '-ar', '48000', '-vn', '-y', output_path
+    ]
+    _run_ffmpeg(cmd, "Error normalizando audio")
 
-def find_offset(ref: np.ndarray, target: np.ndarray, max_shift: int = 16000*5) -> int:
+def find_offset(ref: np.ndarray, target: np.ndarray, max_shift: int = 16000*5, method: str = 'fft') -> int:
     """
-    Calcula el offset óptimo (en muestras) para alinear target con ref usando correlación cruzada.
-    max_shift limita el desfase máximo buscado (por defecto 5s a 16kHz).
+    Calcula el offset óptimo (en muestras) para alinear target con ref usando
+    correlación cruzada por FFT: O(n log n) contra el O(n²) de np.correlate,
+    que a 16kHz y ventanas de 10s es la diferencia entre milisegundos y
+    minutos. max_shift limita el desfase máximo buscado (por defecto 5s) y el
+    argmax solo se evalúa dentro de esa ventana de lags.
+
+    method='gcc-phat' aplica blanqueo de fase (PHAT) al espectro cruzado:
+    el pico queda más angosto y robusto a ruido/reverb cuando las pistas
+    vienen de micrófonos distintos en la misma sala.
     """
     if len(target) > len(ref):
         target = target[:len(ref)]
     if len(ref) > len(target):
         ref = ref[:len(target)]
-    corr = np.correlate(ref, target, mode='full')
+    n = len(ref)
+    if n == 0:
+        return 0
+    size = 1 << (2 * n - 1).bit_length()
+    if method == 'gcc-phat':
+        spectrum = np.fft.rfft(ref, size) * np.conj(np.fft.rfft(target, size))
+        spectrum /= np.abs(spectrum) + 1e-10
+        xcorr = np.fft.irfft(spectrum, size)
+        max_shift = min(max_shift, n - 1)
+        # lags 0..max_shift al inicio del buffer, negativos al final (wrap)
+        candidates = np.concatenate((xcorr[:max_shift + 1], xcorr[-max_shift:]))
+        best = int(np.argmax(candidates))
+        return best if best <= max_shift else best - (2 * max_shift + 1)
+    # Equivalente a np.correlate(ref, target, 'full') vía convolución FFT
+    corr = np.fft.irfft(np.fft.rfft(ref, size) * np.fft.rfft(target[::-1], size), size)[:2 * n - 1]
     mid = len(corr) // 2
-    search_range = (mid - max_shift, mid + max_shift)
-    best = np.argmax(corr[search_range[0]:search_range[1]])
-    offset = best + search_range[0] - mid
-    return offset
+    lo = max(0, mid - max_shift)
+    hi = min(len(corr), mid + max_shift)
+    best = np.argmax(corr[lo:hi])
+    return int(best + lo - mid)
 
-def process_videos_fast(video1_path, video2_path, ref_audio_path, output_path, preview_duration=None, batch_duration=60):
+@functools.lru_cache(maxsize=64)
+def _build_segment_filter(segments_key, scale_step, filter_suffix, offset1=0.0, offset2=0.0):
     """
-    Procesamiento optimizado por batches de 1 minuto, tolerante a fallos y reanudable.
+    Codegen del grafo trim/concat para una timeline dada, memoizado por
+    (segmentos, escala, sufijo, offsets): batches con la misma estructura de
+    cortes (al reanudar o con el fallback regular) no re-generan el string.
+    Los offsets por cámara desplazan los trims al eje de tiempo de cada fuente.
     """
-    # Obtener duración total
-    def get_duration(path):
-        cmd = [
-            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1', path
+    # Patrón lista-y-join: construcción lineal del grafo, sin += de strings
+    n_segments = len(segments_key)
+    filter_parts = [
+        f"[{0 if speaker == 1 else 1}:v]trim=start={start_s + (offset1 if speaker == 1 else offset2):.2f}:duration={end_s - start_s:.2f},setpts=PTS-STARTPTS{scale_step}{filter_suffix}[v{i}];"
+        for i, (start_s, end_s, speaker) in enumerate(segments_key)
+    ]
+    video_concat = "".join(f"[v{i}]" for i in range(n_segments))
+    filter_parts.append(f"{video_concat}concat=n={n_segments}:v=1:a=0[outv];")
+    return "".join(filter_parts)
+
+# Configuración compartida por todos los batches, cargada una vez por worker
+# (el payload picklado de cada job queda en solo índice/tiempos/salida)
+_worker_config = None
+
+def _init_batch_worker(config):
+    """Initializer del pool: fija la configuración compartida del worker."""
+    global _worker_config
+    _worker_config = config
+
+def _process_batch_job(batch_idx, start, dur, batch_path):
+    """Entrada por-job del pool: delega en _process_batch con la config compartida."""
+    return _process_batch(batch_idx, start=start, dur=dur, batch_path=batch_path,
+                          **_worker_config)
+
+def _process_batch(batch_idx, n_batches, start, dur, video1_path, video2_path,
+                   ref_audio_path, batch_path, batch_suffix, hwaccel_params,
+                   filter_suffix='', stream_copy_cuts=False, min_segment=2.0,
+                   scale_filter='scale=1920:1080', analysis_sr=16000,
+                   drift_check=True):
+    """
+    Genera un batch completo: cortes, sincronización, timeline y ensamblaje.
+    A nivel de módulo (y con argumentos simples) para ser picklable por
+    ProcessPoolExecutor: cada batch corre en su propio intérprete, sin GIL
+    compartido con los demás.
+    """
+    print(f"\n🚩 Procesando batch {batch_idx+1}/{n_batches} ({start:.1f}s - {start+dur:.1f}s, duración {dur:.1f}s)")
+    temp_files = []
+    try:
+        # Recortar videos para el batch; cada invocación demuxea la fuente UNA
+        # vez y emite dos outputs: el clip stream-copy y el WAV de análisis
+        # (fusión a nivel de invocación: menos procesos, menos re-lecturas)
+        def cut_clip_and_audio(input_path, clip_suffix):
+            temp_clip = tempfile.NamedTemporaryFile(suffix=clip_suffix, delete=False).name
+            temp_files.append(temp_clip)
+            # -noaccurate_seek: saltar directo al keyframe sin re-decodificar
+            # desde el anterior; la precisión exacta no importa porque la
+            # sincronización por correlación cruzada corrige el offset después.
+            # El audio de análisis sale como PCM crudo por pipe:1, directo a
+            # NumPy: sin WAV intermedio en disco
+            cmd = [
+                'ffmpeg', '-y', '-noaccurate_seek', '-ss', str(start), '-t', str(dur),
+                '-i', input_path,
+                '-map', '0', '-c', 'copy', '-avoid_negative_ts', 'make_zero', temp_clip,
+                '-map', '0:a', '-ac', '1', '-ar', str(analysis_sr), '-f', 's16le', 'pipe:1'
+            ]
+            pcm = _run_ffmpeg_capture(cmd, "Error recortando clip")
+            return temp_clip, np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        # Audio de referencia: la pista final (alta calidad) va a archivo y el
+        # PCM de análisis sale del mismo decode por pipe, en una sola invocación
+        temp_audio_ref_final = tempfile.NamedTemporaryFile(suffix=f'_ref_final_b{batch_idx+1}.wav', delete=False).name
+        temp_files.append(temp_audio_ref_final)
+        ref_cmd = [
+            'ffmpeg', '-y', '-ss', str(start), '-t', str(dur),
+            '-i', ref_audio_path,
+            '-vn', '-c:a', 'pcm_s16le', temp_audio_ref_final,
+            '-ac', '1', '-ar', str(analysis_sr), '-vn', '-f', 's16le', 'pipe:1'
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise RuntimeError(f"Error obteniendo duración: {result.stderr}")
-        return float(result.stdout.strip())
 
-    total_duration = min(get_duration(video1_path), get_duration(video2_path), get_duration(ref_audio_path))
-    n_batches = int(np.ceil(total_duration / batch_duration))
-    batches_dir = os.path.join('output', 'batches')
-    os.makedirs(batches_dir, exist_ok=True)
-    batch_files = []
-    progreso = tqdm(total=n_batches, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]', desc='Batches procesados')
-    tiempo_inicio = time.time()
+        # Los tres cortes iniciales son independientes: lanzarlos en paralelo
+        # (los threads solo esperan subprocesos, que liberan el GIL)
+        with ThreadPoolExecutor(max_workers=3) as steps:
+            future_v1 = steps.submit(cut_clip_and_audio, video1_path, f'_v1_b{batch_idx+1}.mp4')
+            future_v2 = steps.submit(cut_clip_and_audio, video2_path, f'_v2_b{batch_idx+1}.mp4')
+            future_ref = steps.submit(_run_ffmpeg_capture, ref_cmd, "Error recortando audio de referencia")
+            # as_completed: el primer corte que falle aborta ya, sin esperar al resto
+            for future in as_completed((future_v1, future_v2, future_ref)):
+                future.result()
+            work_video1, audio1 = future_v1.result()
+            work_video2, audio2 = future_v2.result()
+            audio_ref = np.frombuffer(future_ref.result(), dtype=np.int16).astype(np.float32) / 32768.0
 
-    for batch_idx in range(n_batches):
-        start = batch_idx * batch_duration
-        end = min((batch_idx + 1) * batch_duration, total_duration)
-        dur = end - start
-        batch_name = f"batch_{batch_idx+1:04d}.mp4"
-        batch_path = os.path.join(batches_dir, batch_name)
-        batch_files.append(batch_path)
-        if os.path.exists(batch_path):
-            print(f"✅ Batch {batch_idx+1}/{n_batches} ya existe, saltando...")
-            progreso.update(1)
-            continue
-        print(f"\n🚩 Procesando batch {batch_idx+1}/{n_batches} ({start:.1f}s - {end:.1f}s, duración {dur:.1f}s)")
-        temp_files = []
-        try:
-            # Recortar videos y audio de referencia para el batch
-            def cut_clip(input_path, suffix):
-                temp_clip = tempfile.NamedTemporaryFile(suffix=suffix, delete=False).name
-                temp_files.append(temp_clip)
-                cmd = [
-                    'ffmpeg', '-ss', str(start), '-t', str(dur),
-                    '-i', input_path,
-                    '-c', 'copy', '-avoid_negative_ts', 'make_zero', '-y', temp_clip
-                ]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise RuntimeError(f"Error recortando clip: {result.stderr}")
-                return temp_clip
-            work_video1 = cut_clip(video1_path, f'_v1_b{batch_idx+1}.mp4')
-            work_video2 = cut_clip(video2_path, f'_v2_b{batch_idx+1}.mp4')
-            
-            # Audio de referencia para análisis (baja calidad, mono, 16kHz)
-            temp_audio_ref_analysis = tempfile.NamedTemporaryFile(suffix=f'_ref_analysis_b{batch_idx+1}.wav', delete=False).name
-            temp_files.append(temp_audio_ref_analysis)
+        # Sincronización al inicio y final del batch
+        sample_rate = analysis_sr
+        n_samples = int(min(10, dur) * sample_rate)
+        max_shift = sample_rate * 5
+        offset1_ini = find_offset(audio_ref[:n_samples], audio1[:n_samples], max_shift)
+        offset2_ini = find_offset(audio_ref[:n_samples], audio2[:n_samples], max_shift)
+        # Si el batch es mayor a 30s, también sincronizar al final. Con
+        # drift_check=False (grabaciones del mismo dominio de reloj) las dos
+        # correlaciones extra se saltan por completo: el drift es cero
+        if drift_check and dur > 30 and len(audio_ref) > n_samples*2:
+            offset1_end = find_offset(audio_ref[-n_samples:], audio1[-n_samples:], max_shift)
+            offset2_end = find_offset(audio_ref[-n_samples:], audio2[-n_samples:], max_shift)
+            drift1 = (offset1_end - offset1_ini) / sample_rate
+            drift2 = (offset2_end - offset2_ini) / sample_rate
+        else:
+            drift1 = drift2 = 0
+        print(f"  Offsets: v1={offset1_ini/sample_rate:.3f}s, v2={offset2_ini/sample_rate:.3f}s | Drift: v1={drift1:.4f}s, v2={drift2:.4f}s")
+        # Análisis de energía/silencios directo sobre los arrays ya
+        # decodificados: los WAV de análisis no se vuelven a decodificar
+        duration1, vol1, silence1 = analyze_energy_from_array(audio1, sample_rate)
+        duration2, vol2, silence2 = analyze_energy_from_array(audio2, sample_rate)
+
+        # Los arrays decodificados ya no se usan: soltarlos antes del encode
+        # pesado para no retener ~MB por minuto de batch durante todo el resto
+        del audio1, audio2, audio_ref
+
+        # Sin pasada intermedia de sincronización: el video nunca se estiraba
+        # (atempo solo tocaba el audio, que al final viene de la referencia),
+        # así que el offset se aplica como corrimiento de tiempo dentro del
+        # ensamblaje y cada cámara se encodea UNA vez en lugar de dos
+        offset_sec1 = max(0, -offset1_ini/sample_rate)
+        offset_sec2 = max(0, -offset2_ini/sample_rate)
+        atempo1 = 1.0 + drift1/dur if abs(drift1) > 0.01 else 1.0
+        atempo2 = 1.0 + drift2/dur if abs(drift2) > 0.01 else 1.0
+
+        def align_silences(silences, offset_sec, atempo):
+            return [(max(0.0, (s - offset_sec) / atempo), (e - offset_sec) / atempo)
+                    for s, e in silences if e > offset_sec]
+        silence1 = align_silences(silence1, offset_sec1, atempo1)
+        silence2 = align_silences(silence2, offset_sec2, atempo2)
+        duration1 = (duration1 - offset_sec1) / atempo1
+        duration2 = (duration2 - offset_sec2) / atempo2
+
+        segments = coalesce_segments(
+            create_simple_timeline(duration1, vol1, silence1, duration2, vol2, silence2, min_segment),
+            min_duration=min_segment)
+        # No dejar que ningún segmento rebase el límite del batch
+        segments = truncate_timeline(segments, dur)
+        # Ensamblaje final del batch, recortando directo de los clips del
+        # batch con el offset de cada cámara sumado a los tiempos de corte
+        # Si ambas cámaras ya comparten geometría, el scale por segmento es
+        # trabajo por-frame innecesario: cortar "en cadena" sin reescalar
+        info1, info2 = get_video_info(work_video1), get_video_info(work_video2)
+        same_geometry = (info1['width'], info1['height']) == (info2['width'], info2['height'])
+        scale_step = '' if same_geometry else ',' + scale_filter
+        if stream_copy_cuts and probe_stream_params(work_video1) == probe_stream_params(work_video2):
+            # Cortes con stream copy: cada segmento sale como paquetes
+            # comprimidos a MPEG-TS (corta limpio en concat aunque el corte
+            # caiga en medio de un GOP) y el batch se arma con mux solamente
+            # — O(bytes de I/O) en vez de decode+encode del batch entero
+            # Cada corte es embarazosamente paralelo (rangos disjuntos, salidas
+            # independientes) y limitado por I/O: un event loop asyncio con
+            # semáforo supervisa todos los ffmpeg sin un thread por proceso
+            # Con -c copy el corte solo es limpio sobre un keyframe: indexar
+            # los keyframes de cada fuente una vez (ffprobe a nivel paquete,
+            # cacheado) y ajustar cada inicio al keyframe anterior
+            keyframes = {1: get_keyframes(work_video1), 2: get_keyframes(work_video2)}
+            # El snap se aplica a la FRONTERA en el eje alineado: el fin del
+            # segmento anterior se mueve junto con el inicio del siguiente.
+            # Así la timeline sigue contigua y el total no se estira respecto
+            # al audio (solo el primer corte puede caer a mitad de GOP).
+            adjusted = [list(seg) for seg in segments]
+            for i in range(1, len(adjusted)):
+                speaker = adjusted[i][2]
+                offset_sec = offset_sec1 if speaker == 1 else offset_sec2
+                snapped = snap_to_keyframe(keyframes[speaker], adjusted[i][0] + offset_sec) - offset_sec
+                snapped = max(snapped, adjusted[i-1][0])
+                adjusted[i][0] = snapped
+                adjusted[i-1][1] = snapped
+            # Un snap puede colapsar el segmento anterior a duración ~cero
+            segments = [tuple(seg) for seg in adjusted if seg[1] - seg[0] > 0.01]
+            ts_segments = []
+            ts_cmds = []
+            for i, (start_s, end_s, speaker) in enumerate(segments):
+                source = work_video1 if speaker == 1 else work_video2
+                offset_sec = offset_sec1 if speaker == 1 else offset_sec2
+                ts_path = tempfile.NamedTemporaryFile(suffix=f'_b{batch_idx+1}_s{i}.ts', delete=False).name
+                temp_files.append(ts_path)
+                ts_segments.append(ts_path)
+                ts_cmds.append(([
+                    'ffmpeg', '-ss', f'{start_s + offset_sec:.3f}', '-i', source,
+                    '-t', f'{end_s - start_s:.3f}',
+                    '-c', 'copy', '-an', '-avoid_negative_ts', 'make_zero',
+                    '-f', 'mpegts', '-y', ts_path
+                ], f"Error extrayendo segmento {i+1} (stream copy)"))
+
+            async def extract_all():
+                sem = asyncio.Semaphore(os.cpu_count() or 4)
+                await asyncio.gather(*(_run_ffmpeg_async(cmd, ctx, sem) for cmd, ctx in ts_cmds))
+            asyncio.run(extract_all())
+            seg_list_path = tempfile.NamedTemporaryFile(suffix=f'_b{batch_idx+1}_segs.txt', delete=False).name
+            temp_files.append(seg_list_path)
+            with open(seg_list_path, 'w') as seg_list:
+                seg_list.writelines(f"file '{_concat_escape(p)}'\n" for p in ts_segments)
             cmd = [
-                'ffmpeg', '-ss', str(start), '-t', str(dur),
-                '-i', ref_audio_path,
-                '-ac', '1', '-ar', '16000', '-vn', '-y', temp_audio_ref_analysis
+                'ffmpeg', '-f', 'concat', '-safe', '0', '-i', seg_list_path,
+                '-i', temp_audio_ref_final,
+                '-map', '0:v', '-map', '1:a',
+                '-c:v', 'copy', '-c:a', 'aac', '-b:a', '128k', '-shortest',
+                '-movflags', '+faststart', '-y', batch_path
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                raise RuntimeError(f"Error recortando audio de referencia para análisis: {result.stderr}")
-            
-            # Audio de referencia para el video final (alta calidad, original)
-            temp_audio_ref_final = tempfile.NamedTemporaryFile(suffix=f'_ref_final_b{batch_idx+1}.wav', delete=False).name
-            temp_files.append(temp_audio_ref_final)
+            _run_ffmpeg(cmd, f"Error en ffmpeg batch {batch_idx+1}")
+            print(f"✅ Batch {batch_idx+1} generado (stream copy): {batch_path}")
+            return batch_idx
+        unique_speakers = {speaker for _, _, speaker in segments}
+        if len(unique_speakers) == 1 and not hwaccel_keeps_gpu_frames(hwaccel_params):
+            # Un solo speaker en todo el batch: una sola pasada de decode
+            # sobre esa fuente con select, sin grafo trim/concat por segmento
+            # (válido también con VideoToolbox, cuyo decode entrega frames sw)
+            speaker = unique_speakers.pop()
+            source = work_video1 if speaker == 1 else work_video2
+            offset_sec = offset_sec1 if speaker == 1 else offset_sec2
+            select_expr = "+".join(f"between(t,{s + offset_sec:.2f},{e + offset_sec:.2f})" for s, e, _ in segments)
             cmd = [
-                'ffmpeg', '-ss', str(start), '-t', str(dur),
-                '-i', ref_audio_path,
-                '-vn', '-c:a', 'pcm_s16le', '-y', temp_audio_ref_final
+                'ffmpeg',
+                '-i', source,
+                '-i', temp_audio_ref_final,  # Audio de referencia en alta calidad
+                '-filter_complex', f"[0:v]select='{select_expr}',setpts=N/FRAME_RATE/TB{scale_step}{filter_suffix}[outv]",
+                '-map', '[outv]',
+                '-map', '1:a',  # Audio de referencia
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                raise RuntimeError(f"Error recortando audio de referencia final: {result.stderr}")
-                
-            # Extracción de audios para análisis
-            temp_audio1 = tempfile.NamedTemporaryFile(suffix=f'_v1_b{batch_idx+1}.wav', delete=False).name
-            temp_audio2 = tempfile.NamedTemporaryFile(suffix=f'_v2_b{batch_idx+1}.wav', delete=False).name
-            temp_files += [temp_audio1, temp_audio2]
-            extract_audio(work_video1, temp_audio1, None)
-            extract_audio(work_video2, temp_audio2, None)
-            
-            # Sincronización al inicio y final del batch
-            audio1 = read_wav_mono(temp_audio1)
-            audio2 = read_wav_mono(temp_audio2)
-            audio_ref = read_wav_mono(temp_audio_ref_analysis)
-            sample_rate = 16000
-            n_samples = int(min(10, dur) * sample_rate)
-            offset1_ini = find_offset(audio_ref[:n_samples], audio1[:n_samples])
-            offset2_ini = find_offset(audio_ref[:n_samples], audio2[:n_samples])
-            # Si el batch es mayor a 30s, también sincronizar al final
-            if dur > 30 and len(audio_ref) > n_samples*2:
-                offset1_end = find_offset(audio_ref[-n_samples:], audio1[-n_samples:])
-                offset2_end = find_offset(audio_ref[-n_samples:], audio2[-n_samples:])
-                drift1 = (offset1_end - offset1_ini) / sample_rate
-                drift2 = (offset2_end - offset2_ini) / sample_rate
-            else:
-                drift1 = drift2 = 0
-            print(f"  Offsets: v1={offset1_ini/sample_rate:.3f}s, v2={offset2_ini/sample_rate:.3f}s | Drift: v1={drift1:.4f}s, v2={drift2:.4f}s")
-            # Ajustar velocidad si hay drift
-            def trim_and_stretch(input_path, offset_samples, drift, suffix):
-                offset_sec = max(0, -offset_samples/sample_rate)
-                temp_vid = tempfile.NamedTemporaryFile(suffix=suffix, delete=False).name
-                temp_files.append(temp_vid)
-                atempo = 1.0
-                if abs(drift) > 0.01:
-                    atempo = 1.0 + drift/dur
-                # Recortar y ajustar velocidad solo del audio
-                cmd = [
-                    'ffmpeg', '-ss', f'{offset_sec:.3f}', '-t', str(dur),
-                    '-i', input_path,
-                    '-filter_complex', f"[0:v]setpts=PTS-STARTPTS[v];[0:a]atempo={atempo:.6f}[a]",
-                    '-map', '[v]', '-map', '[a]',
-                    '-c:v', 'libx264', '-preset', 'slow',
-                    '-c:a', 'aac', '-b:a', '128k',
-                    '-avoid_negative_ts', 'make_zero', '-y', temp_vid
-                ]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise RuntimeError(f"Error sincronizando y ajustando velocidad: {result.stderr}")
-                return temp_vid
-            sync_video1 = trim_and_stretch(work_video1, offset1_ini, drift1, f'_sync1_b{batch_idx+1}.mp4')
-            sync_video2 = trim_and_stretch(work_video2, offset2_ini, drift2, f'_sync2_b{batch_idx+1}.mp4')
-            temp_files += [sync_video1, sync_video2]
-            # Análisis de energía/silencios
-            duration1, vol1, silence1 = get_audio_energy_fast(sync_video1)
-            duration2, vol2, silence2 = get_audio_energy_fast(sync_video2)
-            segments = create_simple_timeline(duration1, vol1, silence1, duration2, vol2, silence2)
-            # Ensamblaje final del batch
-            filter_parts = []
-            for i, (start_s, end_s, speaker) in enumerate(segments):
-                input_idx = 0 if speaker == 1 else 1
-                seg_dur = end_s - start_s
-                filter_parts.append(f"[{input_idx}:v]trim=start={start_s:.2f}:duration={seg_dur:.2f},setpts=PTS-STARTPTS,scale=1920:1080[v{i}];")
-            n_segments = len(segments)
-            video_concat = "".join([f"[v{i}]" for i in range(n_segments)])
-            filter_parts.append(f"{video_concat}concat=n={n_segments}:v=1:a=0[outv];")
-            complex_filter = "".join(filter_parts)
+        else:
+            complex_filter = _build_segment_filter(tuple(segments), scale_step, filter_suffix,
+                                                   offset_sec1, offset_sec2)
             cmd = [
                 'ffmpeg',
-                '-i', sync_video1,
-                '-i', sync_video2,
+                *hwaccel_params, '-i', work_video1,
+                *hwaccel_params, '-i', work_video2,
                 '-i', temp_audio_ref_final,  # Audio de referencia en alta calidad
                 '-filter_complex', complex_filter,
                 '-map', '[outv]',
                 '-map', '2:a',  # Audio de referencia
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast',   
-                '-crf', '18',            # Mejor calidad visual
-                '-pix_fmt', 'yuv420p',   # Compatibilidad máxima
-                '-c:a', 'copy',          # Audio intocable
-                '-movflags', '+faststart',
-                '-threads', '0',
-                '-y',
-                batch_path
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                print(f"❌ Error en ffmpeg batch {batch_idx+1}: {result.stderr}")
-                raise RuntimeError(f"Error en ffmpeg batch {batch_idx+1}")
-            print(f"✅ Batch {batch_idx+1} generado: {batch_path}")
-            progreso.update(1)
-        except Exception as e:
-            print(f"💥 Error en batch {batch_idx+1}: {e}")
-            print(f"Deteniendo el procesamiento. Puedes reanudar luego.")
-            break
-        finally:
-            for temp_file in temp_files:
-                try:
-                    if os.path.exists(temp_file):
-                        os.unlink(temp_file)
-                except Exception as e:
-                    print(f"⚠️  No se pudo limpiar {temp_file}: {e}")
-    progreso.close()
-    # Concatenar todos los batches generados
-    print("\n🔗 Concatenando todos los batches...")
+        cmd += [*batch_suffix, batch_path]
+        _run_ffmpeg(cmd, f"Error en ffmpeg batch {batch_idx+1}")
+        print(f"✅ Batch {batch_idx+1} generado: {batch_path}")
+        return batch_idx
+    finally:
+        cleanup_async(list(temp_files))
+
+def process_videos_fast(video1_path, video2_path, ref_audio_path, output_path, preview_duration=None, batch_duration=60, reencode_final=False, encoder='auto', transition='cut', transition_duration=0.5, normalize=False, max_workers=None, stream_copy_cuts=False, quality=None, min_segment=2.0, analysis_sr=16000, drift_check=True):
+    """
+    Procesamiento optimizado por batches de 1 minuto, tolerante a fallos y reanudable.
+    Los batches se generan en paralelo con ProcessPoolExecutor (max_workers
+    procesos; por defecto hasta 4 según los cores disponibles).
+    Con encoder='auto' se usa el encoder por hardware disponible (VideoToolbox en M1).
+    Con reencode_final=False (por defecto) el concat final se hace con stream copy
+    (solo mux, limitado por I/O); si los batches no comparten parámetros de codec
+    se recodifica automáticamente para evitar un archivo corrupto.
+    """
+    if max_workers is None:
+        max_workers = min(4, os.cpu_count() or 1)
+    video_params = get_video_params(encoder, quality)
+    if preview_duration and video_params[1] == 'libx264':
+        # Un preview es descartable: no pagar el encode de calidad completa
+        video_params = PREVIEW_VIDEO_PARAMS
+    hwaccel_params = get_hwaccel_params(encoder)
+    thread_params = get_thread_params(encoder, parallel_jobs=max_workers)
+    filter_suffix = get_filter_suffix(encoder)
+    scale_filter = get_scale_filter(encoder, hwaccel_params)
+    if normalize:
+        # Normalizar el audio de referencia una sola vez, antes de los batches.
+        # El nombre lleva un hash de (ruta, mtime, tamaño): si la referencia
+        # cambia se invalida solo, y si no, las corridas siguientes lo saltan.
+        st = os.stat(ref_audio_path)
+        cache_key = hashlib.sha1(
+            f'{os.path.abspath(ref_audio_path)}:{st.st_mtime_ns}:{st.st_size}'.encode()
+        ).hexdigest()[:8]
+        normalized_ref = os.path.join('output', f'ref_normalizado_{cache_key}.wav')
+        os.makedirs('output', exist_ok=True)
+        if not os.path.exists(normalized_ref):
+            print("🔊 Normalizando audio de referencia (loudnorm, una pasada)...")
+            # Escribir a un temporal .wav y os.replace: nunca queda un archivo
+            # a medias visible (y ffmpeg infiere el muxer por la extensión)
+            tmp_ref = normalized_ref + '.tmp.wav'
+            normalize_audio(ref_audio_path, tmp_ref)
+            os.replace(tmp_ref, normalized_ref)
+        ref_audio_path = normalized_ref
+    # -pix_fmt solo aplica a frames en memoria de sistema; con cuda/qsv/vaapi
+    # el formato lo fija la cadena de filtros en GPU
+    pix_fmt_params = () if hwaccel_keeps_gpu_frames(hwaccel_params) else ('-pix_fmt', 'yuv420p')
+    batch_suffix = (*video_params,
+                    *pix_fmt_params,         # Compatibilidad máxima
+                    '-c:a', 'copy',          # Audio intocable
+                    '-movflags', '+faststart',
+                    *thread_params,
+                    '-y')
+    # Obtener duración total (un solo ffprobe por archivo, cacheado)
+    total_duration = min(get_video_info(video1_path)['duration'],
+                         get_video_info(video2_path)['duration'],
+                         get_video_info(ref_audio_path)['duration'])
+    if preview_duration:
+        total_duration = min(total_duration, preview_duration)
+    n_batches = int(np.ceil(total_duration / batch_duration))
+    batches_dir = os.path.join('output', 'batches')
+    os.makedirs(batches_dir, exist_ok=True)
+    batch_files = []
+    # Lista de concat escrita en streaming: cada batch se anota al completarse,
+    # sin acumular un segundo pase sobre los archivos al final
     concat_list = os.path.join(batches_dir, 'concat_list.txt')
-    with open(concat_list, 'w') as f:
-        for batch_path in batch_files:
+    tiempo_inicio = time.time()
+
+    # Context managers: el handle de la lista y la barra se cierran de forma
+    # determinista aunque un batch explote, sin depender del GC
+    with open(concat_list, 'w', buffering=1 << 20) as concat_f, \
+         tqdm(total=n_batches, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]', desc='Batches procesados') as progreso:
+
+        # Escritura ordenada de la lista de concat aunque los batches terminen
+        # fuera de orden: buffer por índice + puntero al próximo contiguo
+        completed = {}
+        next_to_write = 0
+
+        def flush_ready():
+            nonlocal next_to_write
+            while next_to_write in completed:
+                concat_f.write(f"file '{_concat_escape(completed[next_to_write])}'\n")
+                next_to_write += 1
+
+        pending_jobs = []
+        for batch_idx in range(n_batches):
+            start = batch_idx * batch_duration
+            end = min((batch_idx + 1) * batch_duration, total_duration)
+            dur = end - start
+            batch_name = f"batch_{batch_idx+1:04d}.mp4"
+            batch_path = os.path.join(batches_dir, batch_name)
+            batch_files.append(batch_path)
             if os.path.exists(batch_path):
-                f.write(f"file '{os.path.abspath(batch_path)}'\n")
-    cmd = [
-        'ffmpeg', '-f', 'concat', '-safe', '0', '-i', concat_list,
-        '-c', 'copy', '-y', output_path
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"❌ Error concatenando batches: {result.stderr}")
+                print(f"✅ Batch {batch_idx+1}/{n_batches} ya existe, saltando...")
+                completed[batch_idx] = batch_path
+                flush_ready()
+                progreso.update(1)
+            else:
+                pending_jobs.append((batch_idx, start, dur, batch_path))
+
+        hubo_errores = False
+        if pending_jobs:
+            worker_config = {
+                'n_batches': n_batches,
+                'video1_path': video1_path,
+                'video2_path': video2_path,
+                'ref_audio_path': ref_audio_path,
+                'batch_suffix': batch_suffix,
+                'hwaccel_params': hwaccel_params,
+                'filter_suffix': filter_suffix,
+                'stream_copy_cuts': stream_copy_cuts and transition == 'cut',
+                'min_segment': min_segment,
+                'scale_filter': scale_filter,
+                'analysis_sr': analysis_sr,
+                'drift_check': drift_check,
+            }
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     initializer=_init_batch_worker,
+                                     initargs=(worker_config,)) as pool:
+                futures = {
+                    pool.submit(_process_batch_job, batch_idx, start, dur, batch_path): (batch_idx, batch_path)
+                    for batch_idx, start, dur, batch_path in pending_jobs
+                }
+                for future in as_completed(futures):
+                    batch_idx, batch_path = futures[future]
+                    try:
+                        future.result()
+                    # Solo los fallos esperables de un batch (ffmpeg, I/O,
+                    # parseo); MemoryError y bugs propagan para no enmascarar
+                    # regresiones. PODCAST_DEBUG=1 relanza con traceback.
+                    except (RuntimeError, OSError, ValueError) as e:
+                        if os.environ.get('PODCAST_DEBUG'):
+                            raise
+                        print(f"💥 Error en batch {batch_idx+1}: {e}")
+                        hubo_errores = True
+                    else:
+                        completed[batch_idx] = batch_path
+                        flush_ready()
+                    progreso.update(1)
+    if hubo_errores:
+        print("Algunos batches fallaron. Puedes reanudar luego: los completados no se reprocesan.")
+        return False
+    # Concatenar todos los batches generados
+    print("\n🔗 Concatenando todos los batches...")
+    # Un solo pase de stat() sobre los batches; el resto del cierre reusa esta lista
+    existing_batches = [b for b in batch_files if os.path.exists(b)]
+    if transition != 'cut' and len(existing_batches) > 1:
+        # Transiciones: un solo grafo xfade/acrossfade en la misma pasada.
+        # Solo pasan las opciones de dispositivo (VAAPI): el decode queda en
+        # software porque xfade no acepta frames de GPU
+        device_params = hwaccel_params if '-vaapi_device' in hwaccel_params else ()
+        cmd = build_transition_concat_cmd(existing_batches, output_path, video_params,
+                                          transition=transition,
+                                          transition_duration=transition_duration,
+                                          device_params=device_params,
+                                          filter_suffix=filter_suffix)
+    else:
+        # Fast path: si todos los batches comparten codec/resolución/pix_fmt, el
+        # concat es solo mux (segundos); si no, recodificar como fallback seguro.
+        if not reencode_final:
+            stream_params = {probe_stream_params(b) for b in existing_batches}
+            if len(stream_params) > 1:
+                print("⚠️  Los batches no comparten parámetros de codec, recodificando el concat final...")
+                reencode_final = True
+        if reencode_final:
+            codec_params = [*video_params, *pix_fmt_params, '-c:a', 'aac', '-b:a', '128k']
+            if filter_suffix:
+                # VAAPI: el concat entrega frames sw; subirlos a GPU antes del encode
+                codec_params += ['-vf', filter_suffix.lstrip(',')]
+        else:
+            codec_params = ['-c', 'copy']
+        cmd = [
+            'ffmpeg', *(hwaccel_params if reencode_final else []),
+            '-f', 'concat', '-safe', '0', '-i', concat_list,
+            *codec_params, '-y', output_path
+        ]
+    barra_concat = tqdm(total=total_duration, desc='Concat final', unit='s',
+                        bar_format='{l_bar}{bar}| {n:.1f}/{total:.1f}s [{elapsed}<{remaining}]')
+    try:
+        _run_ffmpeg(cmd, "Error concatenando batches", progress_bar=barra_concat)
+    except RuntimeError as e:
+        print(f"❌ {e}")
         return False
+    finally:
+        barra_concat.close()
     print(f"🎉 Video final generado: {output_path}")
+    try:
+        final_duration, final_size = _probe_format(output_path)
+        print(f"📊 Duración: {final_duration:.1f}s | Tamaño: {final_size / (1024*1024):.1f} MB")
+    except (RuntimeError, ValueError):
+        pass  # El print informativo no debe tumbar un render exitoso
     tiempo_total = time.time() - tiempo_inicio
     print(f"⏱️  Tiempo total transcurrido: {tiempo_total:.1f} segundos")
     return True
 
+def quick_cut_preview(video1_path, video2_path, output_path, preview_duration=60):
+    """
+    Preview instantáneo sin re-encode: corta los primeros N segundos de cada
+    cámara con stream copy, analiza silencios, y ensambla los cortes con el
+    concat demuxer (inpoint/outpoint) también en stream copy. Todo el camino
+    es I/O-bound: ningún frame pasa por un encoder.
+    """
+    temp_video1, temp_video2 = create_preview_clips(video1_path, video2_path, preview_duration)
+    if temp_video1 is None:
+        return False
+    concat_file = None
+    try:
+        with ThreadPoolExecutor(max_workers=2) as steps:
+            future_e1 = steps.submit(get_audio_energy_fast, temp_video1)
+            future_e2 = steps.submit(get_audio_energy_fast, temp_video2)
+            duration1, vol1, silence1 = future_e1.result()
+            duration2, vol2, silence2 = future_e2.result()
+        segments = coalesce_segments(create_simple_timeline(duration1, vol1, silence1, duration2, vol2, silence2))
+        concat_file = create_ffmpeg_concat_file(segments, temp_video1, temp_video2)
+        cmd = [
+            'ffmpeg', '-f', 'concat', '-safe', '0', '-i', concat_file,
+            '-c', 'copy', '-y', output_path
+        ]
+        _run_ffmpeg(cmd, "Error generando preview rápido")
+        # Un solo os.stat para el reporte (sin el par exists+getsize)
+        try:
+            size_mb = os.stat(output_path).st_size / (1024 * 1024)
+            print(f"🎬 Preview rápido generado: {output_path} ({size_mb:.1f} MB)")
+        except FileNotFoundError:
+            print(f"🎬 Preview rápido generado: {output_path}")
+        return True
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return False
+    finally:
+        cleanup_async([p for p in (temp_video1, temp_video2, concat_file) if p])
+
+def _require_nonempty(path):
+    """Valida con UN solo os.stat que el archivo exista y no esté vacío."""
+    try:
+        if os.stat(path).st_size == 0:
+            print(f"❌ Error: {path} está vacío")
+            sys.exit(1)
+    except FileNotFoundError:
+        print(f"❌ Error: {path} no existe")
+        sys.exit(1)
+
 def main():
     parser = argparse.ArgumentParser(description='Cambio automático de cámaras ultra-optimizado')
     parser.add_argument('video1', help='Primer video (persona 1)')
@@ -472,23 +1263,76 @@ def main():
     parser.add_argument('-o', '--output', default='output_switched.mp4', help='Archivo de salida')
     parser.add_argument('-p', '--preview', type=int, help='Duración del preview en segundos')
     parser.add_argument('--min-segment', type=float, default=2.0, help='Duración mínima de segmento en segundos')
+    parser.add_argument('--reencode-final', action='store_true', help='Recodifica el video en el concat final en vez de stream copy')
+    parser.add_argument('--encoder', default='auto', choices=['auto'] + sorted(ENCODER_PARAMS),
+                        help='Encoder de video (auto detecta hardware disponible)')
+    parser.add_argument('--transition', default='cut', choices=['cut', 'fade', 'dissolve'],
+                        help='Transición entre batches (cut = corte duro con concat)')
+    parser.add_argument('--transition-duration', type=float, default=0.5,
+                        help='Duración de la transición en segundos')
+    parser.add_argument('--normalize-audio', action='store_true',
+                        help='Normaliza el loudness del audio de referencia (loudnorm, una pasada)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Batches procesados en paralelo (por defecto hasta 4 según cores)')
+    parser.add_argument('--quality', default=None, choices=sorted(QUALITY_SETTINGS),
+                        help='Nivel de calidad CRF (por defecto, los parámetros nativos del encoder)')
+    parser.add_argument('--stream-copy-cuts', action='store_true',
+                        help='Ensambla los cortes con stream copy (MPEG-TS + concat) sin re-encodear cada batch')
+    parser.add_argument('--sync-sr', type=int, default=16000,
+                        help='Sample rate del audio de análisis/sincronización (8000 reduce el costo de FFT a la mitad)')
+    parser.add_argument('--quick-test', action='store_true',
+                        help='Preview instantáneo por concat demuxer (stream copy, sin sincronización ni re-encode)')
+    parser.add_argument('--no-drift-check', action='store_true',
+                        help='Omite la corrección de drift (cámaras con el mismo dominio de reloj)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Perfila la corrida con cProfile y muestra los 40 hotspots acumulados')
+    parser.add_argument('--profile-out', default=None,
+                        help='Archivo pstats de salida para snakeviz/kcachegrind (implica --profile)')
     args = parser.parse_args()
+    if args.profile or args.profile_out:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            _run_cli(args)
+        finally:
+            profiler.disable()
+            if args.profile_out:
+                profiler.dump_stats(args.profile_out)
+                print(f"📈 Perfil guardado en {args.profile_out}")
+            else:
+                pstats.Stats(profiler).sort_stats('cumulative').print_stats(40)
+        return
+    _run_cli(args)
+
+def _run_cli(args):
+    """Cuerpo del CLI, separado para poder envolverlo con cProfile."""
     check_dependencies()
-    if not os.path.exists(args.video1):
-        print(f"❌ Error: {args.video1} no existe")
-        sys.exit(1)
-    if not os.path.exists(args.video2):
-        print(f"❌ Error: {args.video2} no existe")
-        sys.exit(1)
-    if not os.path.exists(args.audio_ref):
-        print(f"❌ Error: {args.audio_ref} no existe")
-        sys.exit(1)
+    _require_nonempty(args.video1)
+    _require_nonempty(args.video2)
+    _require_nonempty(args.audio_ref)
+    if args.quick_test:
+        if not quick_cut_preview(args.video1, args.video2, args.output, args.preview or 60):
+            sys.exit(1)
+        return
     success = process_videos_fast(
         args.video1,
         args.video2,
         args.audio_ref,
         args.output,
-        preview_duration=args.preview
+        preview_duration=args.preview,
+        reencode_final=args.reencode_final,
+        encoder=args.encoder,
+        transition=args.transition,
+        transition_duration=args.transition_duration,
+        normalize=args.normalize_audio,
+        max_workers=args.jobs,
+        stream_copy_cuts=args.stream_copy_cuts,
+        quality=args.quality,
+        min_segment=args.min_segment,
+        analysis_sr=args.sync_sr,
+        drift_check=not args.no_drift_check
     )
     if success:
         print(f"\n🎉 Proceso completado!")